@@ -1,14 +1,160 @@
 import arxiv
+import functools
 import json
+import mmap
 import os
-from typing import List
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from typing import List, Optional
 from dotenv import load_dotenv
 import anthropic
 
+# orjson is an optional speedup; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Loaded before the settings below so they can also come from .env
+load_dotenv()
+
 PAPER_DIR = "papers"
+MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-7-sonnet-20250219")
+INDEX_FILE = os.path.join(PAPER_DIR, "_index.json")
+
+# Topic files at least this large are parsed straight from a memory map
+MMAP_THRESHOLD = 1024 * 1024
+
+# Longest string field sent back to Claude in a tool result
+MAX_FIELD_CHARS = 2000
+
+# Extracts author names in C rather than a Python-level comprehension
+author_name = attrgetter("name")
+
+# Lazily loaded mapping of paper ID -> topic directory holding its info
+_INDEX = None
+
+# Serializes updates to the stored paper info, since tools can run concurrently
+_STORE_LOCK = threading.RLock()
+
+### JSON Helpers
+
+def loads_json(data: bytes):
+    """
+    Parse JSON bytes, using orjson when it is installed.
+    Args:
+        data (bytes): The raw JSON document.
+    Returns:
+        The parsed JSON value.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json(obj, indent: bool = False) -> bytes:
+    """
+    Serialize a value to JSON bytes, using orjson when it is installed.
+    Args:
+        obj: The value to serialize.
+        indent (bool): Whether to pretty-print with a two-space indent.
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode()
+
+def load_papers_info(file_path: str) -> dict:
+    """
+    Load the stored paper info of a single topic.
+    Args:
+        file_path (str): Path of the topic's papers_info.json file.
+    Returns:
+        dict: The paper info keyed by paper ID.
+    """
+    with open(file_path, 'rb') as f:
+        if orjson is not None and os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            # Parse large files from the page cache without first copying them into a bytes object
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+        return loads_json(f.read())
+
+@functools.lru_cache(maxsize=64)
+def _load_topic_info(file_path: str, mtime_ns: int) -> dict:
+    """
+    Load a topic's paper info, memoized on the file's modification time so
+    any write to the file invalidates the cached copy.
+    The returned dict is shared between callers and must not be mutated.
+    """
+    return load_papers_info(file_path)
+
+@functools.lru_cache(maxsize=256)
+def _paper_json(file_path: str, mtime_ns: int, paper_id: str) -> Optional[str]:
+    """
+    Serialize one paper's info from a topic file, memoized like _load_topic_info.
+    """
+    papers_info = _load_topic_info(file_path, mtime_ns)
+    if paper_id in papers_info:
+        # Compact output: Claude doesn't need indentation, and it costs input tokens
+        return dumps_json(truncate_fields(papers_info[paper_id])).decode()
+    return None
+
+def get_paper_json(file_path: str, paper_id: str) -> Optional[str]:
+    """
+    Get the JSON info of a paper stored in a topic file.
+    Args:
+        file_path (str): Path of the topic's papers_info.json file.
+        paper_id (str): The ID of the paper to look for.
+    Returns:
+        Optional[str]: JSON string with the paper info, or None if the paper is not in the file.
+    """
+    return _paper_json(file_path, os.stat(file_path).st_mtime_ns, paper_id)
+
+### Paper Index
+
+def load_index() -> dict:
+    """
+    Get the paper ID -> topic directory index, reading it from disk on first use.
+    Returns:
+        dict: The in-memory index.
+    """
+    global _INDEX
+    with _STORE_LOCK:
+        if _INDEX is None:
+            try:
+                with open(INDEX_FILE, 'rb') as f:
+                    _INDEX = loads_json(f.read())
+            except (FileNotFoundError, json.JSONDecodeError):
+                _INDEX = {}
+    return _INDEX
+
+def save_index() -> None:
+    """
+    Write the in-memory paper index back to disk.
+    """
+    os.makedirs(PAPER_DIR, exist_ok=True)
+    with open(INDEX_FILE, 'wb') as f:
+        f.write(dumps_json(load_index()))
 
 ### Tool Functions
 
+@functools.lru_cache(maxsize=128)
+def topic_dir_path(topic: str) -> str:
+    """
+    Get the directory storing a topic's papers, creating it on first use.
+    Memoized so repeat searches on a topic skip the name normalization and mkdir call.
+    Args:
+        topic (str): The topic searched for.
+    Returns:
+        str: Path of the topic directory.
+    """
+    path = os.path.join(PAPER_DIR, topic.lower().replace(" ", "_"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
 def search_papers(topic: str, max_results: int = 5) -> List [str]:
     """
     Search for academic papers on arXiv based on a given topic and store their info.
@@ -25,40 +171,77 @@ def search_papers(topic: str, max_results: int = 5) -> List [str]:
         max_results=max_results,
         sort_by=arxiv.SortCriterion.Relevance
     )
-    papers = client.results(search)
 
-    # Create a dirrectory for this topic
-    path=os.path.join(PAPER_DIR, topic.lower().replace(" ", "_"))
-    os.makedirs(path, exist_ok=True)
-
-    file_path=os.path.join(path, "papers_info.json")
-
-    # Load existing data if available
-    try:
-        with open(file_path, 'r') as f:
-            papers_info = json.load(f)
-    except FileNotFoundError:
-        papers_info = {}
-    
-    # Store paper info
-    paper_ids = []
-    for paper in papers:
-        paper_ids.append(paper.get_short_id())
-        papers_info[paper.get_short_id()] = {
+    # Build every paper's record in one pass, resolving each short ID once
+    new_papers = [
+        (paper.get_short_id(), {
             "title": paper.title,
             "summary": paper.summary,
-            "authors": [author.name for author in paper.authors],
+            "authors": list(map(author_name, paper.authors)),
             "published": paper.published.isoformat(),
             "updated": paper.updated.isoformat(),
             "pdf_url": paper.pdf_url
-        }
+        })
+        for paper in client.results(search)
+    ]
+    paper_ids = [paper_id for paper_id, _ in new_papers]
+    if not paper_ids:
+        # Nothing to store, so don't create a topic directory or report a file that was never written
+        print(f"Found no papers on topic '{topic}'; nothing was saved.")
+        return paper_ids
+
+    # Create a dirrectory for this topic
+    path=topic_dir_path(topic)
+
+    file_path=os.path.join(path, "papers_info.json")
+
+    with _STORE_LOCK:
+        # Skip reading and rewriting the file when the index shows every paper is already stored in it
+        index = load_index()
+        topic_dir = os.path.basename(path)
+        if os.path.isfile(file_path) and all(index.get(paper_id) == topic_dir for paper_id in paper_ids):
+            print(f"Found {len(paper_ids)} papers on topic '{topic}'.")
+            print(f"Paper info in {file_path} is already up to date.")
+            return paper_ids
+
+        # Load existing data if available
+        try:
+            papers_info = load_papers_info(file_path)
+        except FileNotFoundError:
+            papers_info = {}
+    
+        # Store the info of papers that aren't in the file yet
+        dirty = False
+        for paper_id, paper_info in new_papers:
+            if paper_id not in papers_info:
+                papers_info[paper_id] = paper_info
+                dirty = True
     
-    # Save the updated paper info to the file
-    with open(file_path, 'w') as f:
-        json.dump(papers_info, f, indent=2)
+        # Save the updated paper info to the file, skipping the rewrite when nothing changed
+        if dirty:
+            data = dumps_json(papers_info, indent=True)
+            try:
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+            except FileNotFoundError:
+                # The topic directory was deleted after topic_dir_path memoized it; forget the
+                # cached paths so the directory is created again, then retry once
+                topic_dir_path.cache_clear()
+                topic_dir_path(topic)
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+
+        # Record the topic directory of newly seen papers in the index
+        new_ids = [paper_id for paper_id in paper_ids if paper_id not in index]
+        if new_ids:
+            index.update(dict.fromkeys(new_ids, topic_dir))
+            save_index()
     
     print(f"Found {len(paper_ids)} papers on topic '{topic}'.")
-    print(f"Paper info saved to {file_path}.")
+    if dirty:
+        print(f"Paper info saved to {file_path}.")
+    else:
+        print(f"Paper info in {file_path} is already up to date.")
     return paper_ids
 
 # search_papers("machine learning", 3)
@@ -72,19 +255,37 @@ def extract_info(paper_id: str) -> str:
     Returns:
         JSON string with paper info if found, error message otherwise.
     """
-    for item in os.listdir(PAPER_DIR):
-        item_path = os.path.join(PAPER_DIR, item)
-        if os.path.isdir(item_path):
-            file_path = os.path.join(item_path, "papers_info.json")
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, 'r') as f:
-                        papers_info = json.load(f)
-                        if paper_id in papers_info:
-                            return json.dumps(papers_info[paper_id], indent=2)
-                except (FileNotFoundError, json.JSONDecodeError) as e:
-                    print(f"Error reading file {file_path}: {e}")
-                    continue
+    # Look up the topic directory in the index so only one file is read
+    index = load_index()
+    topic_dir = index.get(paper_id)
+    if topic_dir is not None:
+        file_path = os.path.join(PAPER_DIR, topic_dir, "papers_info.json")
+        try:
+            paper_json = get_paper_json(file_path, paper_id)
+            if paper_json is not None:
+                return paper_json
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Error reading file {file_path}: {e}")
+
+    # Fall back to scanning every topic directory and backfill the index on a hit
+    # (scandir entries cache their type, and a missing file is caught on open)
+    with os.scandir(PAPER_DIR) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            file_path = os.path.join(entry.path, "papers_info.json")
+            try:
+                paper_json = get_paper_json(file_path, paper_id)
+                if paper_json is not None:
+                    with _STORE_LOCK:
+                        index[paper_id] = entry.name
+                        save_index()
+                    return paper_json
+            except FileNotFoundError:
+                continue
+            except json.JSONDecodeError as e:
+                print(f"Error reading file {file_path}: {e}")
+                continue
     return f"No saved information found related to the paper {paper_id}"
 
 # info = extract_info("1707.04849v1")
@@ -128,6 +329,19 @@ tools=[
     }
 ]
 
+### Programmatic Tool Calling
+
+# With programmatic tool calling Claude calls the tools from code it runs in a
+# code execution container, so intermediate tool results never enter the
+# conversation. It needs a model that supports it, so it is opt-in.
+PROGRAMMATIC_TOOL_CALLING = os.getenv("PROGRAMMATIC_TOOL_CALLING", "").lower() in ("1", "true", "yes")
+PROGRAMMATIC_TOOL_CALLING_BETA = "advanced-tool-use-2025-11-20"
+CODE_EXECUTION_TOOL = {"type": "code_execution_20260120", "name": "code_execution"}
+
+programmatic_tools = [
+    {**tool, "allowed_callers": [CODE_EXECUTION_TOOL["type"]]} for tool in tools
+] + [CODE_EXECUTION_TOOL]
+
 
 ### Tool Mapping
 tool_mapping = {
@@ -135,6 +349,19 @@ tool_mapping = {
     "extract_info": extract_info
 }
 
+def truncate_fields(info: dict) -> dict:
+    """
+    Shorten long string fields so tool results don't inflate the conversation.
+    Args:
+        info (dict): The tool result to shorten.
+    Returns:
+        dict: A copy with string values cut to MAX_FIELD_CHARS characters.
+    """
+    return {
+        key: value[:MAX_FIELD_CHARS] + "…" if isinstance(value, str) and len(value) > MAX_FIELD_CHARS else value
+        for key, value in info.items()
+    }
+
 def execute_tool(tool_name: str, input_data: dict) -> str:
     """
     Execute a tool based on its name and input data.
@@ -145,19 +372,30 @@ def execute_tool(tool_name: str, input_data: dict) -> str:
         str: The result of the tool execution.
     """
     result=tool_mapping[tool_name](**input_data)
+    # Structured results are returned as compact JSON, which is unambiguous for Claude to read
     if result is None:
-        result = json.dumps({"error": "The operation completed but didn't return any results."}, indent=2)
+        result = dumps_json({"error": "The operation completed but didn't return any results."}).decode()
     elif isinstance(result, list):
-        result = ','.join(result)
+        result = dumps_json(result).decode()
     elif isinstance(result, dict):
-        result = json.dumps(result, indent=2)
+        result = dumps_json(truncate_fields(result)).decode()
     else:
         result = str(result)
     return result
 
-load_dotenv()
 client = anthropic.Client()
 
+# Runs the independent tool calls of a single Claude turn concurrently
+tool_executor = ThreadPoolExecutor(max_workers=4)
+
+# Seconds to wait between checks on a submitted message batch
+BATCH_POLL_INTERVAL = 30
+
+# Approximate token budget for the conversation sent to Claude, and the number
+# of most recent tool results that are always kept verbatim
+HISTORY_TOKEN_BUDGET = 8000
+KEEP_RECENT_TOOL_RESULTS = 2
+
 # def process_query(query: str) -> str:
 #     """
 #     Process a query using the Anthropic API.
@@ -227,6 +465,88 @@ client = anthropic.Client()
 #                     process_query = False
 #     return final_response
 
+def trim_history(messages: list) -> None:
+    """
+    Replace the oldest tool results with a short placeholder once the
+    conversation grows past the token budget, since every turn resends it.
+    Args:
+        messages (list): The conversation so far, modified in place.
+    """
+    # Roughly four characters per token
+    excess = len(str(messages)) // 4 - HISTORY_TOKEN_BUDGET
+    if excess <= 0:
+        return
+    tool_results = [
+        block
+        for message in messages if message['role'] == 'user' and isinstance(message['content'], list)
+        for block in message['content'] if block.get('type') == 'tool_result'
+    ]
+    for block in tool_results[:len(tool_results) - KEEP_RECENT_TOOL_RESULTS]:
+        # execute_tool always returns a string, so its length is the size of the text
+        content = block['content']
+        if content.startswith("<truncated:"):
+            continue
+        placeholder = f"<truncated: {len(content)} characters of prior tool results>"
+        block['content'] = placeholder
+        excess -= (len(content) - len(placeholder)) // 4
+        if excess <= 0:
+            break
+
+def open_stream(messages: list, container_id: Optional[str] = None):
+    """
+    Open a streaming request to Claude, using programmatic tool calling when it is enabled.
+    Args:
+        messages (list): The conversation so far.
+        container_id (Optional[str]): The code execution container to reuse, if any.
+    Returns:
+        The message stream context manager.
+    """
+    if PROGRAMMATIC_TOOL_CALLING:
+        return client.beta.messages.stream(
+            model=MODEL,
+            tools=programmatic_tools,
+            messages=messages,
+            max_tokens=1000,
+            betas=[PROGRAMMATIC_TOOL_CALLING_BETA],
+            container=container_id,
+        )
+    return client.messages.stream(
+        model=MODEL,
+        tools=tools,
+        messages=messages,
+        max_tokens=1000,
+    )
+
+def stream_response(messages: list, container_id: Optional[str] = None):
+    """
+    Stream a Claude response, printing text as it arrives and starting each
+    tool call as soon as its input is complete.
+    Args:
+        messages (list): The conversation so far.
+        container_id (Optional[str]): The code execution container to reuse, if any.
+    Returns:
+        The final message, and a dict mapping each tool use ID to the future of its result.
+    """
+    tool_futures = {}
+    # Identical tool calls in the same turn share a single execution
+    calls = {}
+    with open_stream(messages, container_id) as stream:
+        for event in stream:
+            if event.type == 'text':
+                print(event.text, end="", flush=True)
+            elif event.type == 'content_block_stop':
+                content = event.content_block
+                if content.type == 'text':
+                    print()
+                elif content.type == 'tool_use':
+                    # Start the tool while Claude is still generating the rest of the turn
+                    print(f"Tool ID: {content.id}, Tool Name: {content.name}, Tool Args: {content.input}")
+                    key = (content.name, json.dumps(content.input, sort_keys=True, default=str))
+                    if key not in calls:
+                        calls[key] = tool_executor.submit(execute_tool, content.name, content.input)
+                    tool_futures[content.id] = calls[key]
+        return stream.get_final_message(), tool_futures
+
 def process_query(query: str) -> str:
     """
     Process a query using the Anthropic API.
@@ -236,73 +556,113 @@ def process_query(query: str) -> str:
         str: The response from the Anthropic API.
     """
     messages = [{'role': 'user', 'content': query}]
-    response = client.messages.create(
-        model="claude-3-7-sonnet-20250219",
-        tools=tools,
-        messages=messages,
-        max_tokens=1000,
-    )
     
-    process_query = True
     final_response = ""
-    # Loop through the response content until all tool uses are processed
-    while process_query:
+    container_id = None
+    # Loop through the responses until Claude stops requesting tools
+    while True:
+        trim_history(messages)
+        response, tool_futures = stream_response(messages, container_id)
+        if getattr(response, "container", None) is not None:
+            # Tool calls made from code must be answered in the same container
+            container_id = response.container.id
         assistant_content = []
 
         for content in response.content:
             if content.type == 'text':
-                print(content.text)
                 final_response = content.text
                 # Adds the text content to the list of assistant contents with proper type field
                 assistant_content.append({"type": "text", "text": content.text})
-                if len(response.content) == 1:
-                    process_query = False
             elif content.type == 'tool_use':
                 # Add the tool use with proper format including type field
-                assistant_content.append({
+                tool_use = {
                     "type": "tool_use",
                     "id": content.id,
                     "name": content.name,
                     "input": content.input
-                })
-                
-                # Add the assistant message with properly formatted content
+                }
+                # Keep track of tool calls made from code execution
+                if getattr(content, "caller", None) is not None:
+                    tool_use["caller"] = content.caller
+                assistant_content.append(tool_use)
+            else:
+                # Code execution blocks are sent back unchanged
+                assistant_content.append(content.to_dict())
+
+        if not tool_futures:
+            if response.stop_reason == "pause_turn":
+                # A long-running code execution was paused; let Claude resume it
                 messages.append({'role': 'assistant', 'content': assistant_content})
+                continue
+            break
 
-                # Executing the Tool
-                tool_id = content.id
-                tool_name = content.name
-                tool_args = content.input
-                print(f"Tool ID: {tool_id}, Tool Name: {tool_name}, Tool Args: {tool_args}")
-                tool_result = execute_tool(tool_name, tool_args)
-
-                # Sending Results Back to Claude
-                messages.append({
-                    "role": "user", 
-                    "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": tool_id,
-                            "content": tool_result
-                        }
-                    ]
-                })
-                
-                # Create a new response with the updated messages
-                response = client.messages.create(
-                    model="claude-3-7-sonnet-20250219",
-                    tools=tools,
-                    messages=messages,
-                    max_tokens=1000,
-                )
-
-                # Check if the response contains only text content
-                if (len(response.content) == 1 and 
-                    response.content[0].type == 'text'):
-                    final_response = response.content[0].text
-                    process_query = False
+        # Add the assistant message with every tool use of this turn
+        messages.append({'role': 'assistant', 'content': assistant_content})
+
+        # Sending all results back to Claude in a single message
+        messages.append({
+            "role": "user", 
+            "content": [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": tool_id,
+                    "content": future.result()
+                }
+                for tool_id, future in tool_futures.items()
+            ]
+        })
     return final_response
 
+def batch_search(topics: List[str]) -> dict:
+    """
+    Search papers for many topics and summarize each topic through the Message Batches API.
+    Batched requests are processed asynchronously at a lower cost, which suits
+    bulk catalog refreshes that do not need an interactive answer.
+    Args:
+        topics (List[str]): The topics to search for.
+    Returns:
+        dict: The summary of each topic, keyed by topic.
+    """
+    # The API rejects an empty batch, so there is nothing to submit without topics
+    if not topics:
+        print("No topics to summarize.")
+        return {}
+
+    # Searching arXiv happens locally, since batched requests cannot run tools
+    paper_ids_per_topic = list(tool_executor.map(search_papers, topics))
+
+    requests = []
+    for i, (topic, paper_ids) in enumerate(zip(topics, paper_ids_per_topic)):
+        papers = "\n\n".join(extract_info(paper_id) for paper_id in paper_ids)
+        requests.append({
+            "custom_id": f"topic-{i}",
+            "params": {
+                "model": MODEL,
+                "max_tokens": 1000,
+                "messages": [{
+                    "role": "user",
+                    "content": f"Summarize the current state of research on '{topic}' based on these papers:\n\n{papers}"
+                }]
+            }
+        })
+
+    batch = client.messages.batches.create(requests=requests)
+    print(f"Submitted batch {batch.id} with {len(requests)} topics.")
+    while batch.processing_status != "ended":
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    summaries = {}
+    for entry in client.messages.batches.results(batch.id):
+        topic = topics[int(entry.custom_id.split("-", 1)[1])]
+        if entry.result.type == "succeeded":
+            summaries[topic] = "".join(
+                content.text for content in entry.result.message.content if content.type == 'text'
+            )
+        else:
+            summaries[topic] = f"Batch request {entry.result.type}."
+    return summaries
+
 def chat_loop():
     """
     Start a chat loop to process user queries.
@@ -321,4 +681,12 @@ def chat_loop():
         except Exception as e:
             print(f"An error occurred: {e}")
 
-chat_loop()
\ No newline at end of file
+if __name__ == "__main__":
+    # Summarize every topic listed in a file, one per line, with: --batch topics.txt
+    if len(sys.argv) == 3 and sys.argv[1] == "--batch":
+        with open(sys.argv[2], 'r') as f:
+            topics = [line.strip() for line in f if line.strip()]
+        for topic, summary in batch_search(topics).items():
+            print(f"\n## {topic}\n{summary}")
+    else:
+        chat_loop()
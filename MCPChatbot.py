@@ -1,87 +1,143 @@
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
-from typing import List
+from typing import Dict, List
 import asyncio
+import importlib.util
+import json
 import nest_asyncio
 
 nest_asyncio.apply()
 load_dotenv()
 
+# Negotiate HTTP/2 with the Anthropic API when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Once the resent conversation is estimated above this many tokens, older tool
+# output is swapped for a placeholder; the newest few results are never touched
+HISTORY_TOKEN_BUDGET = 8000
+KEEP_RECENT_TOOL_RESULTS = 2
+
+# Seconds a single tool call may take before it is reported as failed
+TOOL_CALL_TIMEOUT = 30
+
 class MCPChatbot:
     def __init__(self):
         # Initialize the session and client objects
         self.session: ClientSession = None
-        self.anthropic = Anthropic()
+        # A single keep-alive connection pool is reused for every request in the session;
+        # the async client lets tool calls run while a response is still streaming
+        self.anthropic = AsyncAnthropic(http_client=DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE))
         self.available_tools: List[dict] = []
+        # Request settings shared by every messages.stream call
+        self._model = 'claude-3-7-sonnet-20250219'
+        self._max_tokens = 2024
+        self._tools_payload: List[dict] = []
+        # In-flight tool calls keyed by (tool name, canonical arguments)
+        self._inflight: Dict[tuple, asyncio.Task] = {}
     
+    async def call_tool(self, tool_name, tool_args):
+        # Identical calls that are already running share a single request to the server
+        key = (tool_name, json.dumps(tool_args, sort_keys=True, default=str))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_tool(tool_name, tool_args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Not shielded: when the turn's task group is cancelled, cancelling the waiting
+        # callers cancels the shared call too, so the server request doesn't outlive the turn
+        return await task
+
+    async def _call_tool(self, tool_name, tool_args):
+        try:
+            # tool invocation through the client session, bounded so a slow tool can't stall the turn
+            result = await asyncio.wait_for(self.session.call_tool(tool_name, arguments=tool_args), timeout=TOOL_CALL_TIMEOUT)
+            return result.content
+        except TimeoutError:
+            error_msg = f"Error executing tool: timed out after {TOOL_CALL_TIMEOUT} seconds"
+            print(error_msg)
+            return error_msg
+        except Exception as e:
+            error_msg = f"Error executing tool: {str(e)}"
+            print(error_msg)
+            return error_msg
+
+    def trim_history(self, messages):
+        # Estimate the request size at about four characters per token and, when it is
+        # over budget, shrink tool output starting from the oldest
+        excess = len(str(messages)) // 4 - HISTORY_TOKEN_BUDGET
+        if excess <= 0:
+            return
+        tool_results = [
+            block
+            for message in messages if message['role'] == 'user' and isinstance(message['content'], list)
+            for block in message['content'] if block.get('type') == 'tool_result'
+        ]
+        for block in tool_results[:len(tool_results) - KEEP_RECENT_TOOL_RESULTS]:
+            content = block['content']
+            # Tool output is a list of content blocks (or an error string); count its text, not its repr
+            text = content if isinstance(content, str) else "".join(getattr(item, 'text', '') for item in content)
+            if text.startswith("<truncated:"):
+                continue
+            placeholder = f"<truncated: {len(text)} characters of earlier tool output>"
+            block['content'] = placeholder
+            excess -= (len(str(content)) - len(placeholder)) // 4
+            if excess <= 0:
+                break
+
+    async def stream_response(self, messages, tool_group):
+        tool_tasks = {}
+        async with self.anthropic.messages.stream(max_tokens=self._max_tokens, model=self._model, tools=self._tools_payload, messages=messages) as stream:
+            async for event in stream:
+                if event.type == 'text':
+                    print(event.text, end="", flush=True)
+                elif event.type == 'content_block_stop':
+                    content = event.content_block
+                    if content.type == 'text':
+                        print()
+                    elif content.type == 'tool_use':
+                        # Start the tool while Claude is still generating the rest of the turn
+                        print(f"Tool ID: {content.id}, Tool Name: {content.name}, Tool Args: {content.input}")
+                        tool_tasks[content.id] = tool_group.create_task(self.call_tool(content.name, content.input))
+            return await stream.get_final_message(), tool_tasks
+
     async def process_query(self, query):
         messages = [{'role':'user', 'content':query}]
-        response = self.anthropic.messages.create(max_tokens = 2024,
-                                      model = 'claude-3-7-sonnet-20250219', 
-                                      tools = self.available_tools, # tools exposed to the LLM
-                                      messages = messages)
-        process_query = True
         final_response = ""
-        while process_query:
-            assistant_content = []
+        while True:
+            self.trim_history(messages)
+            # The task group owns this turn's tool calls and waits for all of them on exit.
+            # Each call reports its own failure as a tool result, so one failing tool never
+            # cancels the others; only an error in the stream itself cancels them, along with
+            # the server requests they are waiting on.
+            try:
+                async with asyncio.TaskGroup() as tool_group:
+                    response, tool_tasks = await self.stream_response(messages, tool_group)
+            except* Exception as eg:
+                # call_tool never raises, so the group only ever wraps the stream's own error;
+                # re-raise it unwrapped so the caller sees the real message
+                raise eg.exceptions[0] from None
             for content in response.content:
                 if content.type =='text':
-                    # print(f"Content: {content}")
                     final_response = content.text
-                    assistant_content.append(content)
-                    if(len(response.content) == 1):
-                        process_query= False
-                elif content.type == 'tool_use':
-                    print(f"Content: {content}")
-                    assistant_content.append(content)
-                    messages.append({'role':'assistant', 'content':assistant_content})
-                    tool_id = content.id
-                    tool_args = content.input
-                    tool_name = content.name
-    
-                    print(f"Tool ID: {tool_id}, Tool Name: {tool_name}, Tool Args: {tool_args}")
-                    
-                    try:
-                        # tool invocation through the client session
-                        result = await self.session.call_tool(tool_name, arguments=tool_args)
-                        messages.append({"role": "user", 
-                                          "content": [
-                                              {
-                                                  "type": "tool_result",
-                                                  "tool_use_id": tool_id,
-                                                  "content": result.content
-                                              }
-                                          ]
-                                        })
-                        response = self.anthropic.messages.create(max_tokens = 2024,
-                                          model = 'claude-3-7-sonnet-20250219', 
-                                          tools = self.available_tools,
-                                          messages = messages) 
-                        
-                        if(len(response.content) == 1 and response.content[0].type == "text"):
-                            print(response.content[0].text)
-                            process_query= False
-                            final_response = response.content[0].text
-                    except Exception as e:
-                        error_msg = f"Error executing tool: {str(e)}"
-                        print(error_msg)
-                        messages.append({"role": "user", 
-                                          "content": [
-                                              {
-                                                  "type": "tool_result",
-                                                  "tool_use_id": tool_id,
-                                                  "content": error_msg
-                                              }
-                                          ]
-                                        })
-                        response = self.anthropic.messages.create(max_tokens = 2024,
-                                          model = 'claude-3-7-sonnet-20250219', 
-                                          tools = self.available_tools,
-                                          messages = messages)
-                        final_response = response.content[0].text
-                        process_query = False
+
+            if not tool_tasks:
+                break
+
+            # Independent tool calls from the same turn ran concurrently
+            messages.append({'role':'assistant', 'content':response.content})
+            results = [task.result() for task in tool_tasks.values()]
+            messages.append({"role": "user", 
+                              "content": [
+                                  {
+                                      "type": "tool_result",
+                                      "tool_use_id": tool_id,
+                                      "content": result
+                                  }
+                                  for tool_id, result in zip(tool_tasks, results)
+                              ]
+                            })
         return final_response
 
     async def chat_loop(self):
@@ -133,6 +189,7 @@ class MCPChatbot:
                             'input_schema': tool.inputSchema
                         } for tool in tools
                     ]
+                    self._tools_payload = self.available_tools
                 
                     # IMPORTANT: Run the chat loop within the session context
                     await self.chat_loop()
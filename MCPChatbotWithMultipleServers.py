@@ -1,16 +1,148 @@
 from dotenv import load_dotenv
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 from mcp import ClientSession, StdioServerParameters, types
 from contextlib import AsyncExitStack
 from mcp.client.stdio import stdio_client
-from typing import List, TypedDict, Dict
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List, Optional, TypedDict, Dict
+import anyio
 import asyncio
+import atexit
+import httpx
+import importlib.util
 import nest_asyncio
 import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shlex
+import sys
+import threading
+import time
 
-nest_asyncio.apply()
+# orjson is an optional speedup; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# nest_asyncio lets the chatbot run inside an already running loop, as in a notebook. It can't patch
+# uvloop, so running this file as a script skips it and may use uvloop instead (see the bottom of the file)
+if __name__ != "__main__":
+    nest_asyncio.apply()
 load_dotenv()
 
+# Negotiate HTTP/2 with the Anthropic API when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# The SDK's default pool drops idle connections after 5 seconds, which would close the connection
+# opened by warm_up() long before the user types a first query; keep idle connections for 5 minutes
+HTTP_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=300)
+
+# Server configuration used when MCP_CONFIG_PATH is not set
+DEFAULT_CONFIG_PATH = "./server_config.json"
+
+# Status and diagnostic messages; console output is written by a listener thread (see setup_logging)
+logger = logging.getLogger("mcp_chatbot")
+# The running listener, once setup_logging has been called
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+# Tools whose results are reused when the same call repeats within the TTL
+CACHEABLE_TOOLS = {"search_papers", "extract_info"}
+# Tools that only read stored data; running any other tool (e.g. a search that stores new papers)
+# may change what later calls and resources return, so it drops both caches
+READ_ONLY_TOOLS = {"extract_info"}
+TOOL_CACHE_TTL = 300
+TOOL_CACHE_SIZE = 128
+# Resources are cached briefly and dropped whenever a tool runs, since a tool may change them
+RESOURCE_CACHE_TTL = 30
+RESOURCE_CACHE_SIZE = 32
+
+# Errors raised by a session whose server process has exited or whose pipe has closed
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                     BrokenPipeError, ConnectionError)
+# Seconds between liveness pings, and how long a ping may take before the server is considered dead
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TIMEOUT = 10
+# Attempts made to reopen a dead connection, with a growing delay between them
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 1
+
+# Shared cache_control marker; the SDK only reads it, so one dict serves every breakpoint
+EPHEMERAL_CACHE = {'type': 'ephemeral'}
+
+# Tool output longer than this is cut before it is added to the conversation, which is resent every turn
+TOOL_RESULT_MAX_CHARS = 8000
+
+# Splits a /prompt argument such as topic="large language models" into its key and value
+PROMPT_ARG_PATTERN = re.compile(r'^([^=]+)=(.*)$', re.DOTALL)
+
+# Queries packed into one request by process_query_batch; returns diminish past this size
+BATCH_SIZE = 8
+
+async def read_input(prompt: str) -> str:
+    """
+    Read a line from the user without blocking the event loop.
+    input() runs on a daemon thread that hands the line back through a future. Unlike
+    asyncio.to_thread, nothing waits for that thread at shutdown, so Ctrl-C exits right away
+    even while the prompt is still open.
+    Args:
+        prompt: The prompt to show.
+    Returns:
+        The line the user entered.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(result=None, error=None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def read():
+        try:
+            line = input(prompt)
+        except Exception as e:
+            callback = (deliver, None, e)
+        else:
+            callback = (deliver, line)
+        try:
+            loop.call_soon_threadsafe(*callback)
+        except RuntimeError:
+            # The loop was closed while waiting for input
+            pass
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Route the chatbot's log records through a queue, so the event loop only enqueues them and
+    the blocking console writes happen on a background thread.
+    Safe to call more than once; the listener is started on the first call and stopped at exit,
+    which flushes any pending records.
+    Returns:
+        The running listener.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, console)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    _log_listener = listener
+    return listener
+
 class ToolDefination(TypedDict):
     name: str
     description: str
@@ -21,158 +153,503 @@ class PromptDefinition(TypedDict):
     description: str
     arguments: dict
 
+class ServerConnection:
+    """
+    A persistent connection to one MCP server that is reopened if the server dies.
+    The stdio transport and session are opened and closed by a dedicated task, because they
+    must be exited by the task that entered them; this is also what lets several servers
+    connect at the same time.
+    """
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.config = config
+        self.session: Optional[ClientSession] = None
+        self.alive = False
+        # Serializes reconnects, so concurrent callers that hit the same dead session reopen it once
+        self.lock = asyncio.Lock()
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def connect(self) -> ClientSession:
+        """
+        Start the server process and initialize a session with it.
+        Returns:
+            The initialized session.
+        """
+        opened = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._serve(opened, self._stop))
+        self.session = await opened
+        self.alive = True
+        return self.session
+
+    async def _serve(self, opened: asyncio.Future, stop: asyncio.Event) -> None:
+        """
+        Open the transport and session, then hold them open until stopped.
+        Args:
+            opened: Future resolved with the session, or failed with the connection error.
+            stop: Event that is set when the connection should be closed.
+        """
+        try:
+            server_params = StdioServerParameters(**self.config)
+            async with AsyncExitStack() as stack:
+                # Create a stdio transport for the server
+                read, write = await stack.enter_async_context(
+                    stdio_client(server_params)
+                )
+                # Create a new ClientSession for the server
+                session = await stack.enter_async_context(
+                    ClientSession(read, write)
+                )
+                await session.initialize()
+                opened.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            self.alive = False
+            if not opened.done():
+                opened.set_exception(e)
+            else:
+                logger.error(f"❌ Error closing connection to server {self.name}: {str(e)}")
+
+    async def run(self, request: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        """
+        Run a request on the session, reconnecting and retrying once if the connection is dead.
+        Args:
+            request: Called with the live session; returns the awaitable request.
+        Returns:
+            The result of the request.
+        """
+        session = self.session
+        if self.alive:
+            try:
+                return await request(session)
+            except CONNECTION_ERRORS as e:
+                self.alive = False
+                logger.warning(f"❌ Lost connection to server {self.name}: {type(e).__name__}")
+        await self.reconnect(session)
+        return await request(self.session)
+
+    async def reconnect(self, dead_session: Optional[ClientSession]) -> None:
+        """
+        Replace a dead session with a new one, unless another caller already did.
+        Args:
+            dead_session: The session that was found to be dead.
+        """
+        async with self.lock:
+            if self.alive and self.session is not dead_session:
+                return
+            await self._close_transport()
+            for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+                try:
+                    await self.connect()
+                    logger.info(f"Reconnected to server: {self.name}")
+                    return
+                except Exception as e:
+                    error = e
+                    if attempt < RECONNECT_ATTEMPTS:
+                        await asyncio.sleep(RECONNECT_DELAY * attempt)
+            raise ConnectionError(f"Could not reconnect to server {self.name}: {str(error)}")
+
+    def start_heartbeat(self) -> None:
+        """
+        Start pinging the server in the background so a dead server is noticed between requests.
+        """
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            session = self.session
+            try:
+                await asyncio.wait_for(session.send_ping(), timeout=HEARTBEAT_TIMEOUT)
+            except Exception as e:
+                self.alive = False
+                logger.warning(f"❌ Server {self.name} did not answer a ping: {type(e).__name__}")
+                try:
+                    await self.reconnect(session)
+                except Exception as e:
+                    logger.error(f"❌ {str(e)}")
+
+    async def _close_transport(self) -> None:
+        self.alive = False
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    async def close(self) -> None:
+        """
+        Stop the heartbeat and close the session and server process.
+        """
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        await self._close_transport()
+
 class MCPChatbot:
+    # Parsed server configurations keyed by absolute path, as (mtime_ns, config); shared by every
+    # instance so re-creating the chatbot, e.g. in a notebook, doesn't re-parse an unchanged file
+    _config_cache: Dict[str, tuple] = {}
+
     def __init__(self):
+        # Status messages must reach the console whether the chatbot runs through main() or is imported
+        setup_logging()
         # Initialize the session and client objects
-        self.sessions: List[ClientSession] = []
-        # exit_stack is a context manager that will manage the mcp client objects and their sessions and ensures that they are properly closed.
-        self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        # One connection per configured server, keyed by server name; each owns its own transport and session,
+        # so cleanup() can close them all at the same time.
+        self.connections: Dict[str, ServerConnection] = {}
+        # The async client yields to the event loop while waiting on the API, so the session reader tasks keep running
+        self.anthropic = AsyncAnthropic(http_client=DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS))
         self.available_tools: List[ToolDefination] = []
         self.available_prompts: List[PromptDefinition] = []
-        # tool_to_session maps the tool name to the corresponding client session; in this way, when the LLM decides on a particular tool name, you can map it to the correct client session so you can use that session to send tool_call request to the right MCP server.
-        self.tool_to_session: Dict[str, ClientSession] = {}
-        self.prompt_to_session: Dict[str, ClientSession] = {}
-        self.resource_to_session: Dict[str, ClientSession] = {}
+        # tool_to_session maps the tool name to the connection of the server that provides it; in this way, when the LLM decides on a particular tool name, you can map it to the correct client session so you can use that session to send tool_call request to the right MCP server.
+        # The maps hold the connection rather than the session itself, so a reconnect replaces the session for every entry at once.
+        self.tool_to_session: Dict[str, ServerConnection] = {}
+        self.prompt_to_session: Dict[str, ServerConnection] = {}
+        self.resource_to_session: Dict[str, ServerConnection] = {}
+        # Tools whose servers annotate them with terminal=true: their output is the answer itself,
+        # so it is returned to the user without another LLM request
+        self.terminal_tools: set = set()
+        # Maps a URI scheme prefix such as "papers://" to the first server exposing resources under it,
+        # so templated URIs (e.g. papers://{topic}) that are never listed still resolve to a session
+        self._resource_prefix_index: Dict[str, ServerConnection] = {}
+        # LRU caches of (timestamp, value), keyed by (tool name, canonical arguments) and resource URI
+        self._tool_cache: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._resource_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # Request settings shared by every messages.stream call, built once; the tool list is
+        # referenced rather than copied, so it stays current as servers register their tools
+        self._create_kwargs = {
+            'max_tokens': 2024,
+            'model': 'claude-3-7-sonnet-20250219',
+            'tools': self.available_tools, # tools exposed to the LLM
+        }
 
     
-    async def connect_to_server(self, server_name: str, server_config: dict)-> None:
+    async def warm_up(self) -> None:
+        """
+        Open the connection to the Anthropic API before the first query, so that query doesn't
+        wait for the TCP and TLS handshakes. Listing models consumes no tokens.
+        """
+        try:
+            await self.anthropic.models.list(limit=1)
+        except Exception as e:
+            logger.warning(f"Could not warm up the Anthropic API connection: {str(e)}")
+
+    async def connect_to_server(self, server_name: str, server_config: dict) -> Optional[tuple]:
         """
         Connect to a server and create a session.
         Args:
             server_name: Name of the server to connect to.
             server_config: Configuration for the server connection.
+        Returns:
+            The server's (tools, prompts, resources) listings, or None if it could not be reached.
         """
+        connection = ServerConnection(server_name, server_config)
+        # Tracked before connecting, so cleanup() also closes a connection that fails part way
+        self.connections[server_name] = connection
         try:
-            server_params = StdioServerParameters(**server_config)
-            # Create a stdio transport for the server
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            # Create a new ClientSession for the server
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            )
-
-            await session.initialize()
-            self.sessions.append(session)
-            print(f"\nConnected to server: {server_name}")
+            session = await connection.connect()
+            logger.info(f"\nConnected to server: {server_name}")
 
             try:
-                # List the tools available on the server
-                response = await session.list_tools()
-                tools = response.tools
-                print(f"Tools available on {server_name}: {[t.name for t in tools]}\n")
-
-                for tool in tools:
-                    self.tool_to_session[tool.name] = session
-                    self.available_tools.append({
-                        'name': tool.name,
-                        'description': tool.description,
-                        'input_schema': tool.inputSchema
-                    })
-
-                # List available prompts
-                prompts_response = await session.list_prompts()
-                print(f"Prompts available on {server_name}: {[p.name for p in prompts_response.prompts]}\n")
-
-                if prompts_response and prompts_response.prompts:
-                    for prompt in prompts_response.prompts:
-                        self.prompt_to_session[prompt.name] = session
-                        self.available_prompts.append({
-                            "name": prompt.name,
-                            "description": prompt.description,
-                            "arguments": prompt.arguments
-                        })
-
-                # List available resources
-                resources_response = await session.list_resources()
-                print(f"Resources available on {server_name}: {[str(r.uri) for r in resources_response.resources]}\n")
-                if resources_response and resources_response.resources:
-                    for resource in resources_response.resources:
-                        resource_uri = str(resource.uri)
-                        self.resource_to_session[resource_uri] = session
+                # The three listings are independent, so request them together
+                response, prompts_response, resources_response = await asyncio.gather(
+                    session.list_tools(), session.list_prompts(), session.list_resources()
+                )
             except Exception as e:
-                print(f"❌ Error listing tools or prompts or resources on server {server_name}: {str(e)}")
+                logger.error(f"❌ Error listing tools or prompts or resources on server {server_name}: {str(e)}")
                 raise
+
+            logger.info(f"Tools available on {server_name}: {[t.name for t in response.tools]}\n")
+            logger.info(f"Prompts available on {server_name}: {[p.name for p in prompts_response.prompts]}\n")
+            logger.info(f"Resources available on {server_name}: {[str(r.uri) for r in resources_response.resources]}\n")
+
+            connection.start_heartbeat()
+            return response.tools, prompts_response.prompts, resources_response.resources
         except Exception as e:
-            print(f"❌ Failed to connect to server {server_name}: {str(e)}")
-    
+            logger.error(f"❌ Failed to connect to server {server_name}: {str(e)}")
+            return None
+
+    def register_server(self, connection: ServerConnection, tools: list, prompts: list, resources: list) -> None:
+        """
+        Make a connected server's tools, prompts and resources available to the chatbot.
+        Args:
+            connection: The server's connection.
+            tools: Tools listed by the server.
+            prompts: Prompts listed by the server.
+            resources: Resources listed by the server.
+        """
+        for tool in tools:
+            # Tool names must be unique in a request; the server listed first in the configuration keeps the name
+            if tool.name in self.tool_to_session:
+                logger.warning(f"Skipping duplicate tool {tool.name} from {connection.name}")
+                continue
+            self.tool_to_session[tool.name] = connection
+            if tool.annotations is not None and getattr(tool.annotations, 'terminal', False):
+                self.terminal_tools.add(tool.name)
+            self.available_tools.append({
+                'name': tool.name,
+                'description': tool.description,
+                'input_schema': tool.inputSchema
+            })
+
+        for prompt in prompts:
+            self.prompt_to_session[prompt.name] = connection
+            self.available_prompts.append({
+                "name": prompt.name,
+                "description": prompt.description,
+                "arguments": prompt.arguments
+            })
+
+        for resource in resources:
+            resource_uri = str(resource.uri)
+            self.resource_to_session[resource_uri] = connection
+            self._resource_prefix_index.setdefault(resource_uri.split("://", 1)[0] + "://", connection)
+
+    @classmethod
+    def load_server_config(cls) -> dict:
+        """
+        Load the server configuration from MCP_CONFIG_PATH, or ./server_config.json by default.
+        The file is only parsed again when its modification time changes.
+        Returns:
+            The parsed configuration.
+        """
+        path = os.path.abspath(os.getenv("MCP_CONFIG_PATH", DEFAULT_CONFIG_PATH))
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = cls._config_cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        cls._config_cache[path] = (mtime_ns, data)
+        return data
+
     async def connect_to_servers(self):
         """
         Connect to multiple servers based on the configuration.
         """
         try:
-            with open("./server_config.json", "r") as f:
-                data = json.load(f)
+            data = self.load_server_config()
             
             servers = data.get("mcpServers", {})
 
-            for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
+            # Servers are independent, so spawn and initialize them all at once
+            results = await asyncio.gather(
+                *(self.connect_to_server(server_name, server_config) for server_name, server_config in servers.items()),
+                return_exceptions=True
+            )
+            # Servers finish connecting in any order; register them in configuration order, so
+            # which server keeps a duplicate name doesn't depend on which one answered first
+            for server_name, result in zip(servers, results):
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Failed to connect to server {server_name}: {str(result)}")
+                elif result is not None:
+                    self.register_server(self.connections[server_name], *result)
+
+            # Sort the tools so the request prefix doesn't depend on the order of the configuration;
+            # the cache breakpoint on the last tool caches the whole list
+            self.available_tools.sort(key=lambda tool: tool['name'])
+            if self.available_tools:
+                self.available_tools[-1]['cache_control'] = EPHEMERAL_CACHE
         except Exception as e:
-            print(f"❌ Error loading server configuration: {str(e)}")
+            logger.error(f"❌ Error loading server configuration: {str(e)}")
             raise
     
 
-    async def process_query(self, query: str) -> str:
+    async def process_query(self, query: str, echo: bool = True) -> str:
         """
         Process the user's query and return a response.
         Args:
             query: The user's input query.
+            echo: Whether to print the response text while it streams.
         Returns:
             The response from the LLM or tool.
         """
         messages = [{'role':'user', 'content': query}]
-        response = self.anthropic.messages.create(max_tokens = 2024,
-                                      model = 'claude-3-7-sonnet-20250219', 
-                                      tools = self.available_tools, # tools exposed to the LLM
-                                      messages = messages)
-        process_query = True
         final_response = ""
-        while process_query:
-            assistant_content = []
-            for content in response.content:
-                if content.type =='text':
-                    # print(content.text)
-                    final_response = content.text
-                    assistant_content.append(content)
-                    if(len(response.content) == 1):
-                        process_query= False
-                elif content.type == 'tool_use':
-                    assistant_content.append(content)
-                    messages.append({'role':'assistant', 'content':assistant_content})
-                    tool_id = content.id
-                    tool_args = content.input
-                    tool_name = content.name
-                    
-    
-                    print(f"Calling tool {tool_name} with args {tool_args}")
-                    
-                    # Call a tool
-                    session = self.tool_to_session[tool_name] # new
-                    result = await session.call_tool(tool_name, arguments=tool_args)
-                    messages.append({"role": "user", 
-                                      "content": [
-                                          {
-                                              "type": "tool_result",
-                                              "tool_use_id":tool_id,
-                                              "content": result.content
-                                          }
-                                      ]
-                                    })
-                    response = self.anthropic.messages.create(max_tokens = 2024,
-                                      model = 'claude-3-7-sonnet-20250219', 
-                                      tools = self.available_tools,
-                                      messages = messages)
-                    if(len(response.content) == 1 and response.content[0].type == "text"):
-                        print(response.content[0].text)
-                        process_query= False
-                        final_response = response.content[0].text
+        # The tool result block currently carrying the conversation cache breakpoint
+        cached_block = None
+        while True:
+            response, tool_uses, text = await self.stream_response(messages, echo)
+            if text is not None:
+                final_response = text
+
+            if not tool_uses:
+                break
+
+            # Independent tool calls run concurrently, so the turn takes as long as the slowest one
+            results = await asyncio.gather(
+                *(self.call_tool(content.name, content.input) for content in tool_uses),
+                return_exceptions=True
+            )
+            # When every call of the turn is a terminal tool and all of them succeeded, their output is
+            # the reply, which saves the follow-up request that would only repeat it
+            if (self.terminal_tools
+                    and all(content.name in self.terminal_tools for content in tool_uses)
+                    and not any(isinstance(result, Exception) or result.isError for result in results)):
+                final_response = "\n".join(block.text for result in results
+                                           for block in result.content if block.type == 'text')
+                break
+            tool_results = [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": content.id,
+                    "content": f"❌ Error calling tool {content.name}: {str(result)}"
+                               if isinstance(result, Exception) else self._tool_result_content(result.content)
+                }
+                for content, result in zip(tool_uses, results)
+            ]
+            # Move the conversation cache breakpoint to the newest tool result so the next request
+            # reuses everything before it; only one is kept since a request allows few breakpoints
+            if cached_block is not None:
+                cached_block.pop('cache_control', None)
+            cached_block = tool_results[-1]
+            cached_block['cache_control'] = EPHEMERAL_CACHE
+            messages.append({'role':'assistant', 'content':response.content})
+            messages.append({"role": "user", "content": tool_results})
         
         return final_response
 
+    async def process_query_batch(self, queries: List[str], batch_size: int = BATCH_SIZE) -> List[str]:
+        """
+        Answer several independent queries, packing up to batch_size of them into each request.
+        Responses are not streamed to the console, since the chunks run concurrently.
+        Args:
+            queries: The queries to answer.
+            batch_size: Maximum number of queries per request, capped at BATCH_SIZE.
+        Returns:
+            The answers, in the same order as the queries.
+        """
+        batch_size = max(1, min(batch_size, BATCH_SIZE))
+        chunks = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+        # The chunks are independent requests, so they run concurrently
+        answers = await asyncio.gather(*(self._process_chunk(chunk) for chunk in chunks))
+        return [answer for chunk_answers in answers for answer in chunk_answers]
+
+    async def _process_chunk(self, queries: List[str]) -> List[str]:
+        """
+        Answer a chunk of queries with a single request, falling back to one request per query
+        if the reply is not a JSON array with one answer per query.
+        """
+        if len(queries) == 1:
+            return [await self.process_query(queries[0], echo=False)]
+
+        tasks = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+        batch_query = (f"You will receive {len(queries)} independent tasks. Complete each of them, then reply with "
+                       f"only a JSON array of {len(queries)} strings holding the answers in order.\n\n{tasks}")
+        response = await self.process_query(batch_query, echo=False)
+        try:
+            answers = json.loads(response[response.index('['):response.rindex(']') + 1])
+            if isinstance(answers, list) and len(answers) == len(queries):
+                return [answer if isinstance(answer, str) else json.dumps(answer) for answer in answers]
+        except ValueError:
+            pass
+        logger.warning(f"❌ Could not split the batched reply into {len(queries)} answers, answering them one by one")
+        return await asyncio.gather(*(self.process_query(query, echo=False) for query in queries))
+
+    async def stream_response(self, messages: list, echo: bool = True) -> tuple:
+        """
+        Stream one response from the LLM, printing its text as it is generated.
+        Args:
+            messages: The conversation so far.
+            echo: Whether to print the text; concurrent batched queries turn it off so
+                their output doesn't interleave.
+        Returns:
+            The final message, the tool_use blocks it requested in order, and the text of its
+            last text block (None if it has no text), collected while streaming.
+        """
+        tool_uses = []
+        text = None
+        async with self.anthropic.messages.stream(**self._create_kwargs, messages=messages) as stream:
+            async for event in stream:
+                if event.type == 'text':
+                    if echo:
+                        print(event.text, end="", flush=True)
+                elif event.type == 'content_block_stop':
+                    content = event.content_block
+                    if content.type == 'text':
+                        if echo:
+                            print()
+                        text = content.text
+                    elif content.type == 'tool_use':
+                        # Each tool call is queued as soon as its block is complete
+                        logger.info(f"Calling tool {content.name} with args {content.input}")
+                        tool_uses.append(content)
+            return await stream.get_final_message(), tool_uses, text
+
+    def _tool_result_content(self, content: list):
+        """
+        Prepare tool output for the conversation, cutting text beyond TOOL_RESULT_MAX_CHARS.
+        Args:
+            content: The content blocks returned by the tool.
+        Returns:
+            The content unchanged, or its text truncated when it is too long.
+        """
+        text = "".join(block.text for block in content if block.type == 'text')
+        if len(text) <= TOOL_RESULT_MAX_CHARS:
+            return content
+        return text[:TOOL_RESULT_MAX_CHARS] + "\n...[truncated]"
+
+    async def call_tool(self, tool_name: str, tool_args: dict) -> types.CallToolResult:
+        """
+        Call a tool on the server that provides it.
+        Args:
+            tool_name: The name of the tool to call.
+            tool_args: The arguments to pass to the tool.
+        Returns:
+            The result of the tool call.
+        """
+        cacheable = tool_name in CACHEABLE_TOOLS
+        if cacheable:
+            key = (tool_name, json.dumps(tool_args, sort_keys=True, default=str))
+            cached = self._cache_get(self._tool_cache, key, TOOL_CACHE_TTL)
+            if cached is not None:
+                return cached
+
+        connection = self.tool_to_session[tool_name]
+        if tool_name not in READ_ONLY_TOOLS:
+            # The tool may change stored data, e.g. a search adds papers that extract_info previously
+            # reported as missing and a topic folder that papers://folders should list
+            self._tool_cache.clear()
+            self._resource_cache.clear()
+        result = await connection.run(lambda session: session.call_tool(tool_name, arguments=tool_args))
+        # Failures, including "not found" answers, are not cached, since a later call can succeed
+        if cacheable and not result.isError:
+            self._cache_put(self._tool_cache, key, result, TOOL_CACHE_SIZE)
+        return result
+
+    def _cache_get(self, cache: OrderedDict, key, ttl: float):
+        """
+        Look up a cache entry that is younger than the TTL.
+        Args:
+            cache: The cache to look in.
+            key: The key of the entry.
+            ttl: Maximum age of the entry in seconds.
+        Returns:
+            The cached value, or None if there is no fresh entry.
+        """
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        timestamp, value = entry
+        if time.monotonic() - timestamp >= ttl:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, cache: OrderedDict, key, value, max_size: int) -> None:
+        """
+        Store a cache entry, evicting the least recently used entries beyond max_size.
+        """
+        cache[key] = (time.monotonic(), value)
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
     async def get_resource(self, resource_uri: str) -> str:
         """
         Retrieve a resource from the MCP server.
@@ -181,25 +658,23 @@ class MCPChatbot:
         Returns:
             The content of the resource.
         """
-        session = self.resource_to_session[resource_uri]
-            
-        # Fallback for paper URIs
-        if not session and resource_uri.startswith("papers://"):
-            for uri, sess in self.resource_to_session.items():
-                if uri.startswith("papers://"):
-                    session = sess
-                    break
-        if not session:
+        cached = self._cache_get(self._resource_cache, resource_uri, RESOURCE_CACHE_TTL)
+        if cached is not None:
+            return cached
+
+        # Exact match first, then fall back to the server that owns the URI scheme
+        connection = (self.resource_to_session.get(resource_uri)
+                      or self._resource_prefix_index.get(resource_uri.split("://", 1)[0] + "://"))
+        if not connection:
             return f"❌ No session found for resource {resource_uri}. Please check the resource URI or server connection."
 
         try:
-            result = await session.read_resource(uri=resource_uri)
+            result = await connection.run(lambda session: session.read_resource(uri=resource_uri))
             # print(f"\n📄 Resource URI: {resource_uri}")
             # print(f"Resource contents: {result.contents}")
             if result and result.contents:
-                output=f"\nRetrieved resource: {resource_uri}"
-                output+="Content:"
-                output+=result.contents[0].text
+                output = "".join((f"\nRetrieved resource: {resource_uri}", "Content:", result.contents[0].text))
+                self._cache_put(self._resource_cache, resource_uri, output, RESOURCE_CACHE_SIZE)
                 return output
             else:
                 return f"Resource {resource_uri} is empty, no content available."
@@ -217,16 +692,16 @@ class MCPChatbot:
         if not self.available_prompts:
             return "No prompts available."
 
-        output = "Available Prompts:\n"
+        # Collect the lines and join once, rather than copying the growing string on every append
+        lines = ["Available Prompts:"]
         for prompt in self.available_prompts:
-            output += f"- {prompt['name']}: {prompt['description']}\n"
+            lines.append(f"- {prompt['name']}: {prompt['description']}")
             if prompt['arguments']:
-                output += "  Arguments:\n"
-                for arg in prompt['arguments']:
-                    arg_name = arg.name if hasattr(arg, 'name') else arg.get('name', '')
-                    output += f"    - {arg_name}\n"
+                lines.append("  Arguments:")
+                lines.extend(f"    - {arg.name if hasattr(arg, 'name') else arg.get('name', '')}"
+                             for arg in prompt['arguments'])
         
-        return output
+        return "\n".join(lines) + "\n"
     
     async def execute_prompt(self, prompt_name: str, arguments: dict) -> str:
         """
@@ -235,12 +710,12 @@ class MCPChatbot:
             prompt_name: The name of the prompt to execute.
             arguments: The arguments to pass to the prompt.
         """
-        session = self.prompt_to_session.get(prompt_name)
-        if not session:
+        connection = self.prompt_to_session.get(prompt_name)
+        if not connection:
             return f"❌ Prompt '{prompt_name}' not found."
 
         try:
-            result = await session.get_prompt(prompt_name, arguments=arguments)
+            result = await connection.run(lambda session: session.get_prompt(prompt_name, arguments=arguments))
             if result and result.messages:
                 prompt_content = result.messages[0].content
 
@@ -253,7 +728,7 @@ class MCPChatbot:
                     text = " ".join(item.text if hasattr(item, 'text') else str(item) 
                                     for item in prompt_content)
                 
-                print(f"\n📃 Executing prompt '{prompt_name}' with arguments {arguments}:\n{text}")
+                logger.info(f"\n📃 Executing prompt '{prompt_name}' with arguments {arguments}:\n{text}")
                 return await self.process_query(text)
         except Exception as e:
             return f"❌ Error executing prompt '{prompt_name}': {str(e)}"
@@ -267,10 +742,12 @@ class MCPChatbot:
         print("Use @<topic> to search papers in that topic")
         print("Use /prompts to list available prompts")
         print("Use /prompt <name> <arg1=value1> to execute a prompt")
+        print("Use /batch <file> to answer the queries in a file, one per line")
 
         while True:
             try:
-                query = input("🧑 You: ").strip()
+                # Read on a background thread so the session reader tasks keep running while the user types
+                query = (await read_input("🧑 You: ")).strip()
                 if not query:
                     print("❌ Please enter a valid query.")
                     continue
@@ -292,24 +769,42 @@ class MCPChatbot:
 
                 # Check for / commands
                 if query.startswith('/'):
-                    parts = query.split()
+                    parts = query.split(maxsplit=1)
                     command = parts[0].lower()
+                    rest = parts[1] if len(parts) > 1 else ""
 
                     if command == '/prompts':
                         prompts_list = await self.list_prompts()
                         print(prompts_list)
                     elif command == '/prompt':
-                        if len(parts) < 2:
+                        try:
+                            # shlex keeps quoted values with spaces together, e.g. topic="graph neural networks"
+                            prompt_parts = shlex.split(rest)
+                        except ValueError:
+                            # Unbalanced quotes, e.g. topic=Alzheimer's; fall back to plain whitespace splitting
+                            prompt_parts = rest.split()
+                        if not prompt_parts:
                             print("Usage: /prompt <name> <arg1=value1> <arg1=value1> ...")
-                        prompt_name = parts[1]
-                        arguments = {}
-                        for arg in parts[2:]:
-                            if '=' in arg:
-                                key, value = arg.split('=', 1)
-                                arguments[key.strip()] = value.strip()
+                            continue
+                        prompt_name = prompt_parts[0]
+                        arguments = {
+                            match.group(1).strip(): match.group(2).strip()
+                            for match in map(PROMPT_ARG_PATTERN.match, prompt_parts[1:]) if match
+                        }
                         
                         prompt_response = await self.execute_prompt(prompt_name, arguments)
                         print(f"\n📜 Prompt Response: {prompt_response}")
+                    elif command == '/batch':
+                        # The path is used as typed, so Windows backslashes and spaces are kept
+                        batch_path = rest.strip().strip('"')
+                        if not batch_path:
+                            print("Usage: /batch <file>")
+                            continue
+                        with open(batch_path, "r") as f:
+                            queries = [line.strip() for line in f if line.strip()]
+                        answers = await self.process_query_batch(queries)
+                        for i, (batch_query, answer) in enumerate(zip(queries, answers), 1):
+                            print(f"\n🤖 [{i}] {batch_query}\n{answer}")
                     else:
                         print(f"❌ Unknown command: {command}")
                     continue
@@ -325,12 +820,20 @@ class MCPChatbot:
         """
         Cleanup resources and close sessions.
         """
-        await self.exit_stack.aclose()
-        print("Closed all sessions and cleaned up resources.")
+        # Each server process is closed independently, so shutdown takes as long as the slowest one
+        connections = list(self.connections.values())
+        results = await asyncio.gather(*(connection.close() for connection in connections), return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Error closing connection to server {connection.name}: {str(result)}")
+        self.connections.clear()
+        logger.info("Closed all sessions and cleaned up resources.")
     
 
 async def main():
     chatbot = MCPChatbot()
+    # The API connection is opened in the background while the servers start
+    warmup = asyncio.create_task(chatbot.warm_up())
 
     try:
         # the mcp clients and sessions are not initialized using "with"
@@ -339,7 +842,17 @@ async def main():
         await chatbot.connect_to_servers()
         await chatbot.chat_loop()
     finally:
+        warmup.cancel()
         await chatbot.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop's libuv-based loop lowers the per-callback cost of the many stdio reader and writer tasks
+    # behind each session; it is optional and not available on Windows
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    if uvloop is not None and sys.platform != "win32":
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -1,11 +1,24 @@
 import arxiv
+import asyncio
 import json
 import os
+from operator import attrgetter
+from pathlib import Path
 from typing import List
 from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+
+# orjson is an optional speedup; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 PAPER_DIR = "papers"
 
+# Extracts author names in C rather than a Python-level comprehension
+author_name = attrgetter("name")
+
 # Make sure the papers directory exists
 os.makedirs(PAPER_DIR, exist_ok=True)
 
@@ -13,8 +26,43 @@ os.makedirs(PAPER_DIR, exist_ok=True)
 # mcp = FastMCP("ResearchServer")
 mcp = FastMCP("ResearchServer", port=8787)
 
+# Serializes updates to the papers_info.json files between concurrent searches
+papers_lock = asyncio.Lock()
+
+# Limits how many searches query arXiv at the same time
+arxiv_semaphore = asyncio.Semaphore(4)
+
+def loads_json(data: bytes):
+    """
+    Parse JSON bytes, using orjson when it is installed.
+    
+    Args:
+        data: The raw JSON document
+        
+    Returns:
+        The parsed JSON value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json(obj, indent: bool = False) -> bytes:
+    """
+    Serialize a value to JSON bytes, using orjson when it is installed.
+    
+    Args:
+        obj: The value to serialize
+        indent: Whether to pretty-print with a two-space indent (default: False)
+        
+    Returns:
+        The UTF-8 encoded JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode()
+
 @mcp.tool()
-def search_papers(topic: str, max_results: int = 5) -> List[str]:
+async def search_papers(topic: str, max_results: int = 5) -> List[str]:
     """
     Search for papers on arXiv based on a topic and store their information.
     
@@ -36,7 +84,9 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
             sort_by=arxiv.SortCriterion.Relevance
         )
 
-        papers = list(client.results(search))  # Convert iterator to list for safer handling
+        # Fetch the results in a worker thread so the blocking HTTP requests don't stall the event loop
+        async with arxiv_semaphore:
+            papers = await asyncio.to_thread(lambda: list(client.results(search)))
         
         # Create directory for this topic
         path = os.path.join(PAPER_DIR, topic.lower().replace(" ", "_"))
@@ -44,39 +94,47 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
         
         file_path = os.path.join(path, "papers_info.json")
 
-        # Try to load existing papers info
-        try:
-            with open(file_path, "r") as json_file:
-                papers_info = json.load(json_file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            papers_info = {}
-
-        # Process each paper and add to papers_info  
-        paper_ids = []
-        for paper in papers:
-            paper_id = paper.get_short_id()
-            paper_ids.append(paper_id)
-            paper_info = {
-                'title': paper.title,
-                'authors': [author.name for author in paper.authors],
-                'summary': paper.summary,
-                'pdf_url': paper.pdf_url,
-                'published': str(paper.published.date())
-            }
-            papers_info[paper_id] = paper_info
+        async with papers_lock:
+            # Try to load existing papers info, reading the file off the event loop
+            try:
+                papers_info = loads_json(await asyncio.to_thread(Path(file_path).read_bytes))
+            except (FileNotFoundError, json.JSONDecodeError):
+                papers_info = {}
+
+            # Process each paper and add the ones not stored yet to papers_info  
+            paper_ids = []
+            dirty = False
+            for paper in papers:
+                paper_id = paper.get_short_id()
+                paper_ids.append(paper_id)
+                if paper_id in papers_info:
+                    continue
+                paper_info = {
+                    'title': paper.title,
+                    'authors': list(map(author_name, paper.authors)),
+                    'summary': paper.summary,
+                    'pdf_url': paper.pdf_url,
+                    'published': str(paper.published.date())
+                }
+                papers_info[paper_id] = paper_info
+                dirty = True
         
-        # Save updated papers_info to json file
-        with open(file_path, "w") as json_file:
-            json.dump(papers_info, json_file, indent=2)
+            # Save updated papers_info to json file, skipping the rewrite when nothing changed
+            if dirty:
+                await asyncio.to_thread(Path(file_path).write_bytes, dumps_json(papers_info, indent=True))
         
         print(f"Found {len(paper_ids)} papers on topic '{topic}'.")
-        print(f"Results are saved in: {file_path}")
+        if dirty:
+            print(f"Results are saved in: {file_path}")
+        else:
+            print(f"Results are already saved in: {file_path}")
         
         return paper_ids
     except Exception as e:
         error_msg = f"❌ Error in search_papers: {str(e)}"
         print(error_msg)
-        return [error_msg]
+        # Raising marks the result as an error, so clients can tell it apart from a list of paper IDs
+        raise ToolError(str(e)) from e
 
 @mcp.tool()
 def extract_info(paper_id: str) -> str:
@@ -87,7 +145,10 @@ def extract_info(paper_id: str) -> str:
         paper_id: The ID of the paper to look for
         
     Returns:
-        JSON string with paper information if found, error message if not found
+        JSON string with paper information
+
+    Raises:
+        ToolError: If no stored paper has this ID, or the papers directory can't be read
     """
     try:
         for item in os.listdir(PAPER_DIR):
@@ -99,16 +160,17 @@ def extract_info(paper_id: str) -> str:
                         with open(file_path, "r") as json_file:
                             papers_info = json.load(json_file)
                             if paper_id in papers_info:
-                                return json.dumps(papers_info[paper_id], indent=2)
+                                # Compact output: Claude doesn't need indentation, and it costs input tokens
+                                return dumps_json(papers_info[paper_id]).decode()
                     except (FileNotFoundError, json.JSONDecodeError) as e:
                         print(f"Error reading {file_path}: {str(e)}")
                         continue
-        
-        return f"There's no saved information related to paper {paper_id}."
     except Exception as e:
         error_msg = f"❌ Error in extract_info: {str(e)}"
         print(error_msg)
-        return error_msg
+        raise ToolError(str(e)) from e
+
+    raise ToolError(f"There's no saved information related to paper {paper_id}.")
 
 @mcp.resource("papers://folders")
 def get_available_folders() -> str: